@@ -2,12 +2,30 @@ import os
 import re
 import json
 import time
-from typing import Dict, Any, Optional
+import asyncio
+import hashlib
+import random
+import csv
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import typing
+from typing import Callable, Dict, Any, List, Optional, Tuple, TypedDict
+import orjson
 import pandas as pd
 from tqdm import tqdm
+from aiolimiter import AsyncLimiter
+from ratelimit import limits, sleep_and_retry
+import diskcache
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
 
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 load_dotenv()
 
 
@@ -16,6 +34,62 @@ if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
 
 
+INPUT_FILE = 'transcripts.xlsx'
+OUTPUT_DIR = 'outputs'
+OUTPUT_FILE = f'{OUTPUT_DIR}/extracted_calls.csv'
+# Rows whose extraction failed permanently; reprocess_failed.py retries them
+DEAD_LETTER_FILE = f'{OUTPUT_DIR}/dead_letter.csv'
+DEAD_LETTER_FIELDS = ['row_index', 'language', 'transcript', 'error']
+DEAD_LETTER_STATUSES = ('llm_failed', 'error')
+
+MODEL_NAME = 'gemini-2.0-flash'
+GENERATION_CONFIG = {
+    'temperature': 0.1,
+    'top_p': 0.95,
+    'top_k': 40,
+    'max_output_tokens': 600,
+    'response_mime_type': 'application/json',
+}
+
+# Free tier allows 15 requests per minute; concurrency only overlaps network latency
+REQUESTS_PER_MINUTE = int(os.getenv('GEMINI_RPM', '15'))
+# Transcripts sent per request; failed batches are split in half down to single rows
+BATCH_SIZE = int(os.getenv('BATCH_SIZE', '4'))
+MAX_OUTPUT_TOKENS_LIMIT = 8192
+# Longer transcripts keep only their head and tail (~4K tokens) to bound prompt size
+MAX_TRANSCRIPT_CHARS = int(os.getenv('MAX_TRANSCRIPT_CHARS', '16000'))
+MAX_CONCURRENT_REQUESTS = int(os.getenv('GEMINI_CONCURRENCY', '5'))
+MAX_BACKOFF_SECONDS = 60
+# Rate limits, server errors and network failures; everything else fails the same way on a retry
+RETRYABLE_ERRORS = (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted,
+                    google_exceptions.ServiceUnavailable, google_exceptions.InternalServerError,
+                    google_exceptions.GatewayTimeout, google_exceptions.DeadlineExceeded, OSError)
+# Batch failures that a smaller batch can fix (timeouts, truncated JSON)
+SPLIT_BATCH_ERRORS = (google_exceptions.DeadlineExceeded, asyncio.TimeoutError, orjson.JSONDecodeError)
+API_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+API_LIMITER = AsyncLimiter(REQUESTS_PER_MINUTE, 60)
+
+# EXECUTOR=threads runs rows through a thread pool with the blocking SDK instead of asyncio
+EXECUTOR = os.getenv('EXECUTOR', 'async')
+THREAD_WORKERS = int(os.getenv('THREAD_WORKERS', '12'))
+
+# Exact-match response cache so re-runs skip already extracted prompts (LLM_CACHE=0 disables)
+LLM_CACHE_DIR = 'outputs/.llm_cache'
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE', '1') != '0'
+
+# Near-duplicate transcripts reuse a previous extraction (opt in with SEMANTIC_CACHE=1)
+SEMANTIC_CACHE_DIR = 'outputs/.semcache'
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE', '0') != '0'
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.93'))
+EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+# Specific to one call, so never copied from a similar transcript
+SEMANTIC_CACHE_PER_CALL_FIELDS = ['customer_name', 'phone_number', 'booking_id', 'amount', 'date_mentioned', 'outcome']
+
+
+INPUT_COLUMNS = ['Romanized Transcript', 'Language']
+# run_all/run_all_threaded take the cleaned, clipped prompt text and the language
+PROMPT_COLUMNS = ['prompt_text', 'Language']
+
 CAR_MODELS = [
     'Nexon', 'Punch', 'Tiago', 'Tigor', 'Altroz', 'Harrier', 'Safari',
     'Curvv', 'Tata EV', 'Nexon EV', 'Punch EV', 'Mahindra', 'Rolls Royce',
@@ -23,137 +97,576 @@ CAR_MODELS = [
 ]
 
 
-def clean_transcript(transcript: str) -> str:
-    if not transcript or not isinstance(transcript, str):
-        return ""
+_WS_RE = re.compile(r'\s+')
+_SPEAKER_RE = re.compile(r'(Agent|Customer)\s*:')
+_PHONE_RE = re.compile(r'\b\d{10}\b|\b\d{5}\s?\d{5}\b|\b\d{3}\s?\d{3}\s?\d{4}\b')
+_AMOUNT_RE = re.compile(r'₹\s?\d+[,\d]*|\b\d+[,\d]*\s?(?:rupees|lakhs|thousands|crores)\b', re.IGNORECASE)
+_DATE_RE = re.compile(r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b')
+
+# Lowercased once at import; the no-C-extension fallback scans these with str.find
+_CAR_MODELS_LOWER = frozenset(m.lower() for m in CAR_MODELS)
+_CAR_MODEL_NAMES = {m.lower(): m for m in CAR_MODELS}
+
+
+def clip_transcript(text: str, max_chars: Optional[int] = MAX_TRANSCRIPT_CHARS) -> str:
+    # MAX_TRANSCRIPT_CHARS=0 (or None here) turns clipping off
+    if max_chars is None or max_chars <= 0 or len(text) <= max_chars:
+        return text
+    head = max_chars // 2
+    return text[:head] + ' ... [truncated] ... ' + text[len(text) - (max_chars - head):]
+
+
+def build_model_automaton():
+    if ahocorasick is None:
+        return None
     
+    automaton = ahocorasick.Automaton()
+    for model in CAR_MODELS:
+        automaton.add_word(model.lower(), model)
+    automaton.make_automaton()
+    return automaton
+
 
-    text = re.sub(r'\s+', ' ', transcript)
-    text = re.sub(r'(Agent|Customer)\s*:', r'\1:', text)
+# Single pass over the transcript for all model names when pyahocorasick is installed
+_MODEL_AUTOMATON = build_model_automaton()
+
+
+def is_word_char(text: str, position: int) -> bool:
+    return 0 <= position < len(text) and (text[position].isalnum() or text[position] == '_')
+
+
+def contains_word(text: str, word: str, boundary_text: Optional[str] = None) -> bool:
+    boundary_text = boundary_text or text
+    start = text.find(word)
+    while start != -1:
+        if not is_word_char(boundary_text, start - 1) and not is_word_char(boundary_text, start + len(word)):
+            return True
+        start = text.find(word, start + 1)
+    return False
+
+
+def detect_car_models(transcript: str) -> str:
+    text = transcript.lower()
+    # Boundaries are checked on the original text unless lowercasing changed its length
+    boundary_text = transcript if len(text) == len(transcript) else text
     
-    return text.strip()
+    if _MODEL_AUTOMATON is None:
+        found_models = {
+            _CAR_MODEL_NAMES[model] for model in _CAR_MODELS_LOWER if contains_word(text, model, boundary_text)
+        }
+    else:
+        found_models = set()
+        for end, model in _MODEL_AUTOMATON.iter(text):
+            start = end - len(model) + 1
+            if not is_word_char(boundary_text, start - 1) and not is_word_char(boundary_text, end + 1):
+                found_models.add(model)
+    return ', '.join(m for m in CAR_MODELS if m in found_models)
 
 
 def extract_with_regex(transcript: str) -> Dict[str, Any]:
     regex_data = {}
-    phone_pattern = r'\b\d{10}\b|\b\d{5}\s?\d{5}\b|\b\d{3}\s?\d{3}\s?\d{4}\b'
-    phones = re.findall(phone_pattern, transcript)
+    phones = _PHONE_RE.findall(transcript)
     regex_data['phone_numbers_found'] = ', '.join(set(phones)) if phones else ''
     
 
-    amount_pattern = r'₹\s?\d+[,\d]*|\b\d+[,\d]*\s?(?:rupees|lakhs|thousands|crores)\b'
-    amounts = re.findall(amount_pattern, transcript, re.IGNORECASE)
+    amounts = _AMOUNT_RE.findall(transcript)
     regex_data['amounts_mentioned'] = ', '.join(amounts[:5]) if amounts else ''
     
 
-    found_models = []
-    for model in CAR_MODELS:
-        if re.search(rf'\b{model}\b', transcript, re.IGNORECASE):
-            found_models.append(model)
-    regex_data['car_models_detected'] = ', '.join(set(found_models)) if found_models else ''
+    regex_data['car_models_detected'] = detect_car_models(transcript)
     
-    date_pattern = r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b'
-    dates = re.findall(date_pattern, transcript)
+    dates = _DATE_RE.findall(transcript)
     regex_data['dates_found'] = ', '.join(dates) if dates else ''
     
     return regex_data
 
 
-def build_extraction_prompt(transcript: str, language: str) -> str:
+def clean_transcript(transcript: Any, max_chars: Optional[int] = MAX_TRANSCRIPT_CHARS) -> str:
+    # Same steps as clean_transcripts: blanks become '', other non-text cells are stringified
+    if not isinstance(transcript, str):
+        transcript = '' if pd.isna(transcript) else str(transcript)
+    
+    text = _WS_RE.sub(' ', transcript)
+    text = _SPEAKER_RE.sub(r'\1:', text)
+    text = text.strip()
+    
+    return clip_transcript(text, max_chars)
+
+
+def clean_transcripts(transcripts: pd.Series) -> pd.Series:
+    return (
+        transcripts.fillna('').astype(str)
+        .str.replace(_WS_RE, ' ', regex=True)
+        .str.replace(_SPEAKER_RE, r'\1:', regex=True)
+        .str.strip()
+    )
+
+
+def extract_regex_columns(cleaned: pd.Series) -> pd.DataFrame:
+    return pd.DataFrame({
+        'regex_phone_numbers': cleaned.str.findall(_PHONE_RE).map(lambda found: ', '.join(dict.fromkeys(found))),
+        'regex_amounts': cleaned.str.findall(_AMOUNT_RE).str[:5].str.join(', '),
+        'regex_car_models': cleaned.map(detect_car_models),
+        'regex_dates': cleaned.str.findall(_DATE_RE).str.join(', '),
+    }, index=cleaned.index)
+
+
+class CallExtraction(TypedDict):
+    call_summary: str
+    intent: str
+    issue_category: str
+    sentiment: str
+    sentiment_score: float
+    customer_name: str
+    agent_name: str
+    showroom_name: str
+    car_model: str
+    location: str
+    date_mentioned: str
+    amount: Optional[float]
+    booking_id: str
+    phone_number: str
+    is_lead: bool
+    priority: str
+    urgency: str
+    next_action: str
+    outcome: str
+    agent_performance: str
+    additional_insights: str
+
 
-    prompt = f"""You are an expert at analyzing customer service call transcripts from automobile showrooms and service centers.
-
-The following is a transcript from a call originally in {language} (now romanized/translated to English):
-
-TRANSCRIPT:
-{transcript}
-
-Extract the following information and return ONLY a valid JSON object (no markdown, no extra text):
-
-{{
-  "call_summary": "A 2-line summary of the call",
-  "intent": "Primary intent/purpose of the customer's call",
-  "issue_category": "One of: technical, sales, booking, complaint, general_inquiry, service_related, test_drive, price_inquiry, other",
-  "sentiment": "One of: positive, neutral, negative",
-  "sentiment_score": 0.5,
-  "customer_name": "Customer's name if mentioned",
-  "agent_name": "Agent's name if mentioned",
-  "showroom_name": "Showroom or service center name if mentioned",
-  "car_model": "Car model(s) discussed (e.g., Tata Nexon, Punch, etc.)",
-  "location": "Location/city mentioned",
-  "date_mentioned": "Any dates mentioned in the call",
-  "amount": "Any price/amount discussed (numeric value only)",
-  "booking_id": "Booking or order ID if mentioned",
-  "phone_number": "Phone number if mentioned",
-  "is_lead": true,
-  "priority": "One of: high, medium, low",
-  "urgency": "One of: high, medium, low",
-  "next_action": "Recommended or mentioned next action",
-  "outcome": "Outcome of the call if evident",
-  "agent_performance": "One of: good, average, poor",
-  "additional_insights": "Any other relevant business insights"
-}}
-
-Rules:
+EXTRACTION_FIELDS = {
+    "call_summary": "A 2-line summary of the call",
+    "intent": "Primary intent/purpose of the customer's call",
+    "issue_category": "One of: technical, sales, booking, complaint, general_inquiry, service_related, test_drive, price_inquiry, other",
+    "sentiment": "One of: positive, neutral, negative",
+    "sentiment_score": 0.5,
+    "customer_name": "Customer's name if mentioned",
+    "agent_name": "Agent's name if mentioned",
+    "showroom_name": "Showroom or service center name if mentioned",
+    "car_model": "Car model(s) discussed (e.g., Tata Nexon, Punch, etc.)",
+    "location": "Location/city mentioned",
+    "date_mentioned": "Any dates mentioned in the call",
+    "amount": "Any price/amount discussed (numeric value only)",
+    "booking_id": "Booking or order ID if mentioned",
+    "phone_number": "Phone number if mentioned",
+    "is_lead": True,
+    "priority": "One of: high, medium, low",
+    "urgency": "One of: high, medium, low",
+    "next_action": "Recommended or mentioned next action",
+    "outcome": "Outcome of the call if evident",
+    "agent_performance": "One of: good, average, poor",
+    "additional_insights": "Any other relevant business insights"
+}
+
+EXTRACTION_RULES = """Rules:
 - Use empty string "" for missing text fields
 - Use null for missing numeric fields
 - Use false for missing boolean fields
 - Ensure all field names match exactly as shown
 - Return ONLY valid JSON, no markdown formatting
 """
-    return prompt
 
 
-def call_gemini_api(prompt: str, max_retries: int = 3) -> Optional[Dict[str, Any]]:
+# Closed-set fields that a local classifier can fill instead of Gemini
+LOCAL_CLASSIFIER_FIELDS = ['sentiment', 'issue_category', 'priority', 'urgency', 'agent_performance']
+LOCAL_CLASSIFIER_DIR = os.getenv('LOCAL_CLASSIFIER_DIR')
+LOCAL_CLASSIFIER_BATCH_SIZE = 32
+
+
+def build_schema_instructions(exclude: Optional[List[str]] = None) -> str:
+    fields = {name: example for name, example in EXTRACTION_FIELDS.items() if name not in (exclude or [])}
+    
+    return f"""You are an expert at analyzing customer service call transcripts from automobile showrooms and service centers.
+
+Each transcript comes from a call originally in the language shown (now romanized/translated to English).
+
+For a single transcript, extract the following information and return ONLY a valid JSON object (no markdown, no extra text):
+
+{json.dumps(fields, indent=2)}
+
+When several numbered transcripts are given, return ONLY a valid JSON array with one such object per transcript, in the same order.
+
+{EXTRACTION_RULES}"""
+
+
+# Static instructions are sent once as the model's system instruction; prompts carry only transcripts
+SCHEMA_INSTRUCTIONS = build_schema_instructions()
+_system_instruction = SCHEMA_INSTRUCTIONS
+
+
+def build_extraction_prompt(transcript: str, language: str) -> str:
+    return f"TRANSCRIPT ({language}):\n{transcript}"
+
+
+def build_extraction_prompt_batch(transcripts: List[Tuple[int, str, str]]) -> str:
+
+    sections = "\n\n".join(
+        f"Transcript {position} (lang={language}):\n{transcript}"
+        for position, (_, transcript, language) in enumerate(transcripts, start=1)
+    )
+    
+    return (f"Return a JSON array of {len(transcripts)} objects, one per transcript below, each with "
+            f"\"transcript_number\" set to the number of the transcript it describes.\n\n{sections}")
+
+
+SCHEMA_TYPES = {str: 'string', float: 'number', int: 'integer', bool: 'boolean'}
+
+
+def schema_for_hint(hint) -> Dict[str, Any]:
+    args = [arg for arg in typing.get_args(hint) if arg is not type(None)]
+    if args:
+        return {'type': SCHEMA_TYPES[args[0]], 'nullable': True}
+    return {'type': SCHEMA_TYPES[hint]}
+
+
+def build_response_schema(exclude: Optional[List[str]] = None) -> Dict[str, Any]:
+    # Built as a dict because the SDK's TypedDict conversion drops "required", which let {} pass
+    fields = {name: hint for name, hint in CallExtraction.__annotations__.items() if name not in (exclude or [])}
+    return {
+        'type': 'object',
+        'properties': {name: schema_for_hint(hint) for name, hint in fields.items()},
+        'required': list(fields),
+    }
+
+
+def build_batch_response_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    # Batch answers carry their transcript number so results can be matched to rows
+    return {
+        'type': 'object',
+        'properties': {'transcript_number': {'type': 'integer'}, **schema['properties']},
+        'required': ['transcript_number'] + schema['required'],
+    }
+
+
+_response_schema = build_response_schema()
+_batch_response_schema = build_batch_response_schema(_response_schema)
+
+
+class JsonStreamCollector:
+
+    def __init__(self):
+        self.text = ''
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.scanning = True
+    
+    def feed(self, chunk: str) -> Optional[Any]:
+        start = len(self.text)
+        self.text += chunk
+        if not self.scanning:
+            return None
+        
+        for offset, char in enumerate(chunk, start=start + 1):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    # Top-level value is closed; anything after it is not needed
+                    try:
+                        return orjson.loads(self.text[:offset])
+                    except orjson.JSONDecodeError:
+                        self.scanning = False
+                        return None
+        return None
+    
+    def finish(self) -> Any:
+        return orjson.loads(self.text)
+
+
+def llm_cache_key(prompt: str, generation_config: Dict[str, Any]) -> str:
+    payload = (prompt.encode() + MODEL_NAME.encode() + _system_instruction.encode()
+               + json.dumps(generation_config, sort_keys=True).encode())
+    return hashlib.blake2b(payload).hexdigest()
+
+
+_model: Optional[genai.GenerativeModel] = None
+_llm_cache: Optional[diskcache.Cache] = None
+
+
+def get_model() -> genai.GenerativeModel:
+    global _model
+    if _model is None:
+        _model = genai.GenerativeModel(MODEL_NAME, system_instruction=_system_instruction)
+    return _model
+
+
+def get_llm_cache() -> Optional[diskcache.Cache]:
+    global _llm_cache
+    if LLM_CACHE_ENABLED and _llm_cache is None:
+        _llm_cache = diskcache.Cache(LLM_CACHE_DIR)
+    return _llm_cache
+
+
+def exclude_llm_fields(fields: List[str]) -> None:
+    global _model, _system_instruction, _response_schema, _batch_response_schema
+    _system_instruction = build_schema_instructions(exclude=fields)
+    _response_schema = build_response_schema(exclude=fields)
+    _batch_response_schema = build_batch_response_schema(_response_schema)
+    _model = None
+
+
+def get_generation_config(batch_size: Optional[int] = None) -> Dict[str, Any]:
+    if batch_size is None:
+        return {**GENERATION_CONFIG, 'response_schema': _response_schema}
+    
+    max_tokens = min(GENERATION_CONFIG['max_output_tokens'] * batch_size, MAX_OUTPUT_TOKENS_LIMIT)
+    return {**GENERATION_CONFIG, 'response_schema': {'type': 'array', 'items': _batch_response_schema},
+            'max_output_tokens': max_tokens}
+
+
+def load_local_classifiers(model_dir: str) -> Dict[str, Tuple[Any, Any]]:
+    paths = {field: os.path.join(model_dir, field) for field in LOCAL_CLASSIFIER_FIELDS}
+    paths = {field: path for field, path in paths.items() if os.path.isdir(path)}
+    if not paths:
+        return {}
+    
+    # Optional dependencies (requirements-local-classifiers.txt), only needed when models exist
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from transformers import AutoTokenizer
+    
+    return {
+        field: (AutoTokenizer.from_pretrained(path), ORTModelForSequenceClassification.from_pretrained(path))
+        for field, path in paths.items()
+    }
+
+
+def tokenizer_signature(tokenizer: Any) -> str:
+    backend = getattr(tokenizer, 'backend_tokenizer', None)
+    spec = backend.to_str() if backend is not None else tokenizer.name_or_path
+    payload = f"{type(tokenizer).__name__}\n{tokenizer.model_max_length}\n{spec}"
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def classify_transcripts(classifiers: Dict[str, Tuple[Any, Any]], texts: pd.Series,
+                         batch_size: int = LOCAL_CLASSIFIER_BATCH_SIZE) -> pd.DataFrame:
+    labels = {field: [] for field in classifiers}
+    values = texts.tolist()
+    
+    # Classifiers fine-tuned from the same base share a tokenizer; encode each batch once per tokenizer
+    groups = {}
+    for field, (tokenizer, model) in classifiers.items():
+        groups.setdefault(tokenizer_signature(tokenizer), (tokenizer, []))[1].append((field, model))
+    
+    for start in range(0, len(values), batch_size):
+        batch = values[start:start + batch_size]
+        for tokenizer, models in groups.values():
+            inputs = tokenizer(batch, padding=True, truncation=True, return_tensors='np')
+            for field, model in models:
+                predictions = model(**inputs).logits.argmax(axis=-1)
+                labels[field].extend(model.config.id2label[int(p)] for p in predictions)
+    
+    return pd.DataFrame(labels, index=texts.index)
+
+
+class SemanticCache:
+
+    def __init__(self, cache_dir: str, threshold: float, model_name: str = EMBEDDING_MODEL):
+        import faiss
+        from sentence_transformers import SentenceTransformer
+        
+        self.faiss = faiss
+        self.threshold = threshold
+        self.encoder = SentenceTransformer(model_name)
+        self.cache_dir = cache_dir
+        self.results_path = os.path.join(cache_dir, 'partitions.json')
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        
+        # One index per partition so entries are only matched against the same schema
+        self.indexes = {}
+        self.results = {}
+        if os.path.exists(self.results_path):
+            with open(self.results_path, 'rb') as f:
+                self.results = orjson.loads(f.read())
+            for partition in self.results:
+                self.indexes[partition] = faiss.read_index(self.index_path(partition))
+    
+    def index_path(self, partition: str) -> str:
+        return os.path.join(self.cache_dir, f'{partition}.faiss')
+    
+    @property
+    def ntotal(self) -> int:
+        return sum(index.ntotal for index in self.indexes.values())
+    
+    def embed(self, text: str):
+        return self.encoder.encode([text], normalize_embeddings=True).astype('float32')
+    
+    def lookup(self, partition: str, embedding) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            index = self.indexes.get(partition)
+            if index is None or index.ntotal == 0:
+                return None
+            
+            scores, ids = index.search(embedding, 1)
+            if scores[0][0] > self.threshold:
+                data = self.results[partition][ids[0][0]]
+                return {key: value for key, value in data.items() if key not in SEMANTIC_CACHE_PER_CALL_FIELDS}
+            return None
+    
+    def add(self, partition: str, embedding, data: Dict[str, Any]) -> None:
+        with self.lock:
+            if partition not in self.indexes:
+                self.indexes[partition] = self.faiss.IndexFlatIP(embedding.shape[1])
+                self.results[partition] = []
+            self.indexes[partition].add(embedding)
+            self.results[partition].append(data)
+    
+    def save(self) -> None:
+        with self.lock:
+            for partition, index in self.indexes.items():
+                self.faiss.write_index(index, self.index_path(partition))
+            with open(self.results_path, 'wb') as f:
+                f.write(orjson.dumps(self.results, option=orjson.OPT_SERIALIZE_NUMPY))
+
+
+def semantic_cache_partition(language: str) -> str:
+    # Runs with fields excluded for local classifiers store partial extractions
+    payload = (str(language) + '\n' + MODEL_NAME + '\n' + EMBEDDING_MODEL + '\n' + _system_instruction
+               + json.dumps(_response_schema, sort_keys=True))
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+_semantic_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    global _semantic_cache
+    if SEMANTIC_CACHE_ENABLED and _semantic_cache is None:
+        _semantic_cache = SemanticCache(SEMANTIC_CACHE_DIR, SEMANTIC_CACHE_THRESHOLD)
+    return _semantic_cache
+
+
+class LLMExtractionError(Exception):
+    pass
+
+
+def backoff_delay(attempt: int) -> float:
+    # Full jitter keeps concurrent workers from retrying in lockstep
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, 2 ** attempt))
+
+
+@sleep_and_retry
+@limits(calls=REQUESTS_PER_MINUTE, period=60)
+def generate_content_limited(model: genai.GenerativeModel, prompt: str, generation_config: Dict[str, Any]):
+    return model.generate_content(prompt, generation_config=generation_config, stream=True)
+
+
+def is_usable_extraction(data: Any) -> bool:
+    return isinstance(data, dict) and bool(data)
+
+
+def call_gemini_api(prompt: str, max_retries: int = 3,
+                    generation_config: Optional[Dict[str, Any]] = None,
+                    validate: Callable[[Any], bool] = is_usable_extraction) -> Optional[Any]:
     if not GEMINI_API_KEY:
         print("ERROR: GEMINI_API_KEY not found in environment variables")
         return None
     
-    model = genai.GenerativeModel('gemini-2.0-flash')
+    generation_config = generation_config or get_generation_config()
+    key = llm_cache_key(prompt, generation_config)
+    llm_cache = get_llm_cache()
+    cached = llm_cache.get(key) if llm_cache is not None else None
+    # Only replies the caller can use are cached, so a rejected reply is requested again next time
+    if cached is not None and validate(cached):
+        return cached
+    
+    model = get_model()
     
     for attempt in range(max_retries):
         try:
-            response = model.generate_content(
-                prompt,
-                generation_config={
-                    'temperature': 0.1,
-                    'top_p': 0.95,
-                    'top_k': 40,
-                    'max_output_tokens': 2048,
-                }
-            )
-            
-            response_text = response.text.strip()
-            response_text = re.sub(r'^```json\s*', '', response_text)
-            response_text = re.sub(r'^```\s*', '', response_text)
-            response_text = re.sub(r'\s*```$', '', response_text)
+            response = generate_content_limited(model, prompt, generation_config)
             
 
-            data = json.loads(response_text)
+            collector = JsonStreamCollector()
+            for chunk in response:
+                data = collector.feed(chunk.text)
+                if data is not None:
+                    break
+            else:
+                data = collector.finish()
+            
+            if llm_cache is not None and validate(data):
+                llm_cache[key] = data
             return data
             
-        except json.JSONDecodeError as e:
-            print(f"Attempt {attempt + 1}/{max_retries}: JSON parsing error - {e}")
+        except RETRYABLE_ERRORS as e:
+            print(f"Attempt {attempt + 1}/{max_retries}: API error - {e}")
             if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
+                time.sleep(backoff_delay(attempt))
             else:
-                print(f"Failed to parse JSON after {max_retries} attempts")
-                return None
-                
+                raise LLMExtractionError(f"Failed API call after {max_retries} attempts: {e}") from e
+            
         except Exception as e:
+            raise LLMExtractionError(f"API call failed: {e}") from e
+    
+    return None
+
+
+async def call_gemini_api_async(prompt: str, max_retries: int = 3,
+                                generation_config: Optional[Dict[str, Any]] = None,
+                                no_retry: Tuple[type, ...] = (),
+                                validate: Callable[[Any], bool] = is_usable_extraction) -> Optional[Any]:
+    if not GEMINI_API_KEY:
+        print("ERROR: GEMINI_API_KEY not found in environment variables")
+        return None
+    
+    generation_config = generation_config or get_generation_config()
+    key = llm_cache_key(prompt, generation_config)
+    llm_cache = get_llm_cache()
+    cached = llm_cache.get(key) if llm_cache is not None else None
+    # Only replies the caller can use are cached, so a rejected reply is requested again next time
+    if cached is not None and validate(cached):
+        return cached
+    
+    model = get_model()
+    
+    for attempt in range(max_retries):
+        try:
+            collector = JsonStreamCollector()
+            async with API_SEMAPHORE, API_LIMITER:
+                response = await model.generate_content_async(prompt, generation_config=generation_config,
+                                                              stream=True)
+                async for chunk in response:
+                    data = collector.feed(chunk.text)
+                    if data is not None:
+                        break
+                else:
+                    data = collector.finish()
+            
+            if llm_cache is not None and validate(data):
+                llm_cache[key] = data
+            return data
+            
+        except no_retry as e:
+            raise LLMExtractionError(f"API call failed: {e}") from e
+            
+        except RETRYABLE_ERRORS as e:
             print(f"Attempt {attempt + 1}/{max_retries}: API error - {e}")
             if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
+                await asyncio.sleep(backoff_delay(attempt))
             else:
-                print(f"Failed API call after {max_retries} attempts")
-                return None
+                raise LLMExtractionError(f"Failed API call after {max_retries} attempts: {e}") from e
+            
+        except Exception as e:
+            raise LLMExtractionError(f"API call failed: {e}") from e
     
     return None
 
 
-def extract_call_info(transcript: str, language: str, row_index: int = 0) -> Dict[str, Any]:
-
-    result = {
+def empty_result(row_index: int, language: str) -> Dict[str, Any]:
+    return {
         'row_index': row_index,
         'original_language': language,
         'call_summary': '',
@@ -180,38 +693,69 @@ def extract_call_info(transcript: str, language: str, row_index: int = 0) -> Dic
         'extraction_status': 'failed',
         'error_message': ''
     }
+
+
+REGEX_FIELDS = ['regex_phone_numbers', 'regex_amounts', 'regex_car_models', 'regex_dates']
+# transcript_key (see transcript_keys) lets a resumed run detect rows whose input changed
+OUTPUT_FIELDS = ['row_index', 'transcript_key'] + list(empty_result(0, ''))[1:] + REGEX_FIELDS
+
+
+def merge_extraction(result: Dict[str, Any], llm_data: Optional[Dict[str, Any]],
+                     regex_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    if llm_data:
+
+        for key, value in llm_data.items():
+            if key in result:
+                result[key] = value
+        
+        result['extraction_status'] = 'success'
+    else:
+        result['extraction_status'] = 'llm_failed'
+        result['error_message'] = 'LLM extraction failed'
     
+    if regex_data is not None:
+        result['regex_phone_numbers'] = regex_data.get('phone_numbers_found', '')
+        result['regex_amounts'] = regex_data.get('amounts_mentioned', '')
+        result['regex_car_models'] = regex_data.get('car_models_detected', '')
+        result['regex_dates'] = regex_data.get('dates_found', '')
+    
+    return result
+
+
+def extract_call_info(transcript: str, language: str, row_index: int = 0,
+                      with_regex: bool = True, preprocess: bool = True) -> Dict[str, Any]:
+    # preprocess=False takes text already cleaned and clipped by clean_transcripts/clip_transcript
 
-    if not transcript or transcript.strip() == '':
+    result = empty_result(row_index, language)
+    cleaned = clean_transcript(transcript, max_chars=None) if preprocess else transcript
+    
+
+    if not cleaned:
         result['error_message'] = 'Empty transcript'
         return result
     
     try:
 
-        cleaned = clean_transcript(transcript)
+        regex_data = extract_with_regex(cleaned) if with_regex else None
+        cleaned = clip_transcript(cleaned) if preprocess else cleaned
         
 
-        regex_data = extract_with_regex(cleaned)
+        semantic_cache = get_semantic_cache()
+        embedding = semantic_cache.embed(cleaned) if semantic_cache else None
+        llm_data = semantic_cache.lookup(semantic_cache_partition(language), embedding) if semantic_cache else None
         
-
-        prompt = build_extraction_prompt(cleaned, language)
-        llm_data = call_gemini_api(prompt)
-        
-        if llm_data:
-
-            for key, value in llm_data.items():
-                if key in result:
-                    result[key] = value
-            
-            result['extraction_status'] = 'success'
+        if llm_data is None:
+            prompt = build_extraction_prompt(cleaned, language)
+            llm_data = call_gemini_api(prompt)
+            merge_extraction(result, llm_data, regex_data)
+            if result['extraction_status'] == 'success' and semantic_cache:
+                semantic_cache.add(semantic_cache_partition(language), embedding, llm_data)
         else:
-            result['extraction_status'] = 'llm_failed'
-            result['error_message'] = 'LLM extraction failed'
+            merge_extraction(result, llm_data, regex_data)
         
-        result['regex_phone_numbers'] = regex_data.get('phone_numbers_found', '')
-        result['regex_amounts'] = regex_data.get('amounts_mentioned', '')
-        result['regex_car_models'] = regex_data.get('car_models_detected', '')
-        result['regex_dates'] = regex_data.get('dates_found', '')
+    except LLMExtractionError as e:
+        result['extraction_status'] = 'llm_failed'
+        result['error_message'] = str(e)
         
     except Exception as e:
         result['extraction_status'] = 'error'
@@ -220,11 +764,200 @@ def extract_call_info(transcript: str, language: str, row_index: int = 0) -> Dic
     return result
 
 
-def main():
+def complete_result(result: Dict[str, Any], llm_data: Optional[Any], embedding: Any) -> None:
+    try:
+        merge_extraction(result, llm_data)
+        
+        semantic_cache = get_semantic_cache()
+        if result['extraction_status'] == 'success' and semantic_cache:
+            semantic_cache.add(semantic_cache_partition(result['original_language']), embedding, llm_data)
+        
+    except Exception as e:
+        result['extraction_status'] = 'error'
+        result['error_message'] = str(e)
+
+
+def match_batch_results(llm_batch: Optional[Any], size: int) -> Optional[List[Dict[str, Any]]]:
+    if not isinstance(llm_batch, list) or len(llm_batch) != size:
+        return None
+    if not all(isinstance(item, dict) for item in llm_batch):
+        return None
+    
+    by_number = {item.get('transcript_number'): item for item in llm_batch}
+    if set(by_number) != set(range(1, size + 1)):
+        return None
+    
+    return [
+        {key: value for key, value in by_number[number].items() if key != 'transcript_number'}
+        for number in range(1, size + 1)
+    ]
 
-    INPUT_FILE = 'transcripts.xlsx'
-    OUTPUT_DIR = 'outputs'
-    OUTPUT_FILE = f'{OUTPUT_DIR}/extracted_calls.csv'
+
+async def complete_pending_async(pending: List[Tuple[Dict[str, Any], str, str, Any]]) -> None:
+    if not pending:
+        return
+    
+    if len(pending) == 1:
+        result, cleaned, language, embedding = pending[0]
+        try:
+            llm_data = await call_gemini_api_async(build_extraction_prompt(cleaned, language))
+        except LLMExtractionError as e:
+            result['extraction_status'] = 'llm_failed'
+            result['error_message'] = str(e)
+            return
+        except Exception as e:
+            result['extraction_status'] = 'error'
+            result['error_message'] = str(e)
+            return
+        complete_result(result, llm_data, embedding)
+        return
+    
+
+    prompt = build_extraction_prompt_batch(
+        [(result['row_index'], cleaned, language) for result, cleaned, language, _ in pending]
+    )
+    try:
+        # Rate limits and transport errors are retried at the same size; a smaller batch would not help
+        llm_batch = await call_gemini_api_async(
+            prompt, generation_config=get_generation_config(len(pending)), no_retry=SPLIT_BATCH_ERRORS,
+            validate=lambda data: match_batch_results(data, len(pending)) is not None
+        )
+    except LLMExtractionError as e:
+        if not isinstance(e.__cause__, SPLIT_BATCH_ERRORS):
+            # Splitting would only multiply requests against the same quota; leave the rows for reprocessing
+            for result, _, _, _ in pending:
+                result['extraction_status'] = 'llm_failed'
+                result['error_message'] = str(e)
+            return
+        llm_batch = None
+    
+    llm_results = match_batch_results(llm_batch, len(pending))
+    if llm_results is not None:
+        for (result, _, _, embedding), llm_data in zip(pending, llm_results):
+            complete_result(result, llm_data, embedding)
+        return
+    
+
+    # Timeouts and truncated, malformed or mismatched arrays: retry as two smaller batches
+    mid = len(pending) // 2
+    await asyncio.gather(complete_pending_async(pending[:mid]), complete_pending_async(pending[mid:]))
+
+
+async def extract_batch_async(rows: List[Tuple[int, str, str]]) -> List[Dict[str, Any]]:
+    # Rows carry transcripts already cleaned and clipped in main()
+
+    results = []
+    pending = []
+    
+    for row_index, cleaned, language in rows:
+        result = empty_result(row_index, language)
+        results.append(result)
+        
+
+        if not cleaned:
+            result['error_message'] = 'Empty transcript'
+            continue
+        
+        try:
+
+            semantic_cache = get_semantic_cache()
+            # Encoding is CPU-bound; keep it off the event loop so in-flight streams keep reading
+            embedding = await asyncio.to_thread(semantic_cache.embed, cleaned) if semantic_cache else None
+            llm_data = semantic_cache.lookup(semantic_cache_partition(language), embedding) if semantic_cache else None
+            
+            if llm_data is None:
+                pending.append((result, cleaned, language, embedding))
+            else:
+                merge_extraction(result, llm_data)
+            
+        except Exception as e:
+            result['extraction_status'] = 'error'
+            result['error_message'] = str(e)
+    
+    await complete_pending_async(pending)
+    return results
+
+
+async def run_all(df: pd.DataFrame, on_result: Callable[[Dict[str, Any]], None]) -> None:
+    rows = list(df[PROMPT_COLUMNS].itertuples(index=True, name=None))
+    batches = [rows[i:i + BATCH_SIZE] for i in range(0, len(rows), BATCH_SIZE)]
+    
+    with tqdm(total=len(rows), desc="Extracting") as progress:
+        async def run_batch(batch):
+            for result in await extract_batch_async(batch):
+                try:
+                    on_result(result)
+                except Exception as e:
+                    # The row is not written, so the next run picks it up again
+                    print(f"Row {result['row_index']}: failed to write result - {e}")
+            progress.update(len(batch))
+        
+        await asyncio.gather(*(run_batch(batch) for batch in batches))
+
+
+def run_all_threaded(df: pd.DataFrame, on_result: Callable[[Dict[str, Any]], None]) -> None:
+    with ThreadPoolExecutor(max_workers=THREAD_WORKERS) as executor:
+        futures = [
+            executor.submit(extract_call_info, transcript, language, idx, with_regex=False, preprocess=False)
+            for idx, transcript, language in df[PROMPT_COLUMNS].itertuples(index=True, name=None)
+        ]
+        
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Extracting"):
+            result = future.result()
+            try:
+                on_result(result)
+            except Exception as e:
+                # The row is not written, so the next run picks it up again
+                print(f"Row {result['row_index']}: failed to write result - {e}")
+
+
+def load_inputs(input_file: str) -> pd.DataFrame:
+    parquet_file = os.path.splitext(input_file)[0] + '.parquet'
+    
+    if os.path.exists(parquet_file) and (
+            not os.path.exists(input_file) or os.path.getmtime(parquet_file) >= os.path.getmtime(input_file)):
+        df = pd.read_parquet(parquet_file, engine='pyarrow', columns=INPUT_COLUMNS, dtype_backend='pyarrow')
+    else:
+        # Parse the workbook once and keep a columnar copy for later runs
+        df = pd.read_excel(input_file, usecols=INPUT_COLUMNS, dtype_backend='pyarrow')
+        df.to_parquet(parquet_file, engine='pyarrow')
+    
+    return df.fillna('')
+
+
+def transcript_keys(cleaned: pd.Series, languages: pd.Series) -> pd.Series:
+    return (languages.astype(str) + '\n' + cleaned).map(
+        lambda text: hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+    )
+
+
+def find_duplicate_rows(keys: pd.Series) -> Dict[int, List[int]]:
+    first_rows = {key: idx for idx, key in keys.drop_duplicates().items()}
+    
+    duplicates = {}
+    for idx, key in keys[keys.duplicated()].items():
+        duplicates.setdefault(first_rows[key], []).append(idx)
+    return duplicates
+
+
+def load_completed_rows(output_file: str) -> pd.Series:
+    if not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
+        return pd.Series(dtype=object)
+    
+    completed = pd.read_csv(output_file, usecols=lambda column: column in ('row_index', 'transcript_key'),
+                            dtype={'transcript_key': str}, keep_default_na=False)
+    if 'transcript_key' not in completed:
+        completed['transcript_key'] = ''
+    return completed.set_index('row_index')['transcript_key']
+
+
+def prune_output_rows(output_file: str, keep: pd.Series) -> None:
+    output_df = pd.read_csv(output_file, dtype=str, keep_default_na=False)
+    output_df = output_df[keep.to_numpy()].reindex(columns=OUTPUT_FIELDS, fill_value='')
+    output_df.to_csv(output_file, index=False)
+
+
+def main():
 
     if not os.getenv('GEMINI_API_KEY'):
         print("ERROR: GEMINI_API_KEY not found!")
@@ -241,44 +974,142 @@ def main():
     
     print(f"Loading data from {INPUT_FILE}...")
     try:
-        df = pd.read_excel(INPUT_FILE)
+        df = load_inputs(INPUT_FILE)
         print(f"Loaded {len(df)} call transcripts")
         print(f"  Columns: {list(df.columns)}")
         print(f"  Languages: {df['Language'].value_counts().to_dict()}\n")
     except Exception as e:
-        print(f"ERROR loading Excel file: {e}")
+        print(f"ERROR loading input file: {e}")
         return
     
 
-    print(f"Processing {len(df)} transcripts...\n")
-    results = []
+    cleaned = clean_transcripts(df['Romanized Transcript'])
+    keys = transcript_keys(cleaned, df['Language'])
+    
+    # Rows are only skipped if the output still holds the same transcript at that row_index
+    completed_keys = load_completed_rows(OUTPUT_FILE)
+    matches = completed_keys.eq(keys.reindex(completed_keys.index))
+    stale_count = int((~matches).sum())
+    if stale_count:
+        print(f"WARNING: {stale_count} rows in {OUTPUT_FILE} no longer match {INPUT_FILE}; "
+              f"dropping them so they are extracted again\n")
+        prune_output_rows(OUTPUT_FILE, matches)
+    
+    completed_rows = set(completed_keys.index[matches])
+    if completed_rows:
+        print(f"Resuming: {len(completed_rows)} rows already in {OUTPUT_FILE} will be skipped\n")
+    df = df[~df.index.isin(completed_rows)]
+    cleaned = cleaned[df.index]
+    keys = keys[df.index]
     
-    for idx, row in tqdm(df.iterrows(), total=len(df), desc="Extracting"):
-        transcript = row['Romanized Transcript']
-        language = row['Language']
+    regex_df = extract_regex_columns(cleaned)
+    prompt_texts = cleaned.map(clip_transcript)
+    
+    truncated = int((cleaned.str.len() > MAX_TRANSCRIPT_CHARS).sum()) if MAX_TRANSCRIPT_CHARS > 0 else 0
+    if truncated:
+        print(f"Truncating {truncated} transcripts longer than {MAX_TRANSCRIPT_CHARS} characters\n")
+    
+    # Identical transcripts are extracted once and the result is copied to the other rows
+    duplicate_rows = find_duplicate_rows(keys)
+    duplicate_count = sum(len(rows) for rows in duplicate_rows.values())
+    if duplicate_count:
+        print(f"Skipping {duplicate_count} duplicate transcripts; their rows reuse the first extraction\n")
+    
+    unique_df = df.assign(prompt_text=prompt_texts)
+    unique_df = unique_df.drop(index=[idx for rows in duplicate_rows.values() for idx in rows])
+    
+    local_df = None
+    if LOCAL_CLASSIFIER_DIR:
+        classifiers = load_local_classifiers(LOCAL_CLASSIFIER_DIR)
+        if classifiers:
+            exclude_llm_fields(list(classifiers))
+            print(f"Classifying {', '.join(classifiers)} locally from {LOCAL_CLASSIFIER_DIR}...")
+            # Duplicate rows take their labels from the first row, like the Gemini fields
+            local_df = classify_transcripts(classifiers, unique_df['prompt_text'][unique_df['prompt_text'] != ''])
+            print(f"Classified {len(local_df)} transcripts; Gemini extracts the remaining fields\n")
+        else:
+            print(f"WARNING: no classifier subfolders ({', '.join(LOCAL_CLASSIFIER_FIELDS)}) "
+                  f"found in {LOCAL_CLASSIFIER_DIR}; Gemini extracts all fields\n")
+    
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        print(f"Semantic cache: {semantic_cache.ntotal} cached extractions "
+              f"(similarity > {SEMANTIC_CACHE_THRESHOLD})\n")
+    
+    if EXECUTOR == 'threads':
+        print(f"Processing {len(unique_df)} transcripts "
+              f"({THREAD_WORKERS} worker threads, {REQUESTS_PER_MINUTE} requests/min)...\n")
+    else:
+        print(f"Processing {len(unique_df)} transcripts "
+              f"({BATCH_SIZE} per request, {MAX_CONCURRENT_REQUESTS} concurrent, "
+              f"{REQUESTS_PER_MINUTE} requests/min)...\n")
+    status_counts = Counter()
+    
+    with open(OUTPUT_FILE, 'a' if completed_rows else 'w', newline='', encoding='utf-8') as f, \
+            open(DEAD_LETTER_FILE, 'w', newline='', encoding='utf-8') as dead_letter_file:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS, extrasaction='ignore')
+        if not completed_rows:
+            writer.writeheader()
+        dead_letter_writer = csv.DictWriter(dead_letter_file, fieldnames=DEAD_LETTER_FIELDS)
+        dead_letter_writer.writeheader()
         
-
-        result = extract_call_info(transcript, language, row_index=idx)
-        results.append(result)
+        def write_result(result: Dict[str, Any]) -> None:
+            source_row = result['row_index']
+            copies = [{**result, 'row_index': idx} for idx in duplicate_rows.get(result['row_index'], [])]
+            
+            for row in [result] + copies:
+                status_counts[row['extraction_status']] += 1
+                
+                # Failed rows stay out of the output so the next run (or reprocess_failed.py) retries them
+                if row['extraction_status'] in DEAD_LETTER_STATUSES:
+                    dead_letter_writer.writerow({
+                        'row_index': row['row_index'],
+                        'language': row['original_language'],
+                        'transcript': df.at[row['row_index'], 'Romanized Transcript'],
+                        'error': row['error_message'],
+                    })
+                    continue
+                
+                row['transcript_key'] = keys[row['row_index']]
+                row.update(regex_df.loc[row['row_index']].to_dict())
+                if local_df is not None and source_row in local_df.index:
+                    row.update(local_df.loc[source_row].to_dict())
+                writer.writerow(row)
+            f.flush()
+            dead_letter_file.flush()
         
-        # Add delay to avoid rate limiting (15 requests per minute = 4 seconds)
-        time.sleep(4)
+        try:
+            if EXECUTOR == 'threads':
+                run_all_threaded(unique_df, write_result)
+            else:
+                asyncio.run(run_all(unique_df, write_result))
+        finally:
+            if semantic_cache:
+                semantic_cache.save()
+    
+    print(f"\nProcessed {sum(status_counts.values())} transcripts this run: {dict(status_counts)}\n")
     
-    print(f"\nProcessed all {len(results)} transcripts!\n")
+    dead_letters = sum(status_counts[status] for status in DEAD_LETTER_STATUSES)
+    if dead_letters:
+        print(f"{dead_letters} failed rows written to {DEAD_LETTER_FILE}; "
+              f"run reprocess_failed.py to retry them\n")
     
 
-    output_df = pd.DataFrame(results)
+    output_df = pd.read_csv(OUTPUT_FILE)
     
 
     print("="*80)
     print("EXTRACTION STATISTICS")
     print("="*80)
-    print(f"\nTotal transcripts: {len(output_df)}")
-    print(f"Successful extractions: {(output_df['extraction_status'] == 'success').sum()}")
-    print(f"Failed extractions: {(output_df['extraction_status'] != 'success').sum()}")
+    # Rows in the dead-letter file are not in the output but still count as failed transcripts
+    total = len(output_df) + dead_letters
+    successful = (output_df['extraction_status'] == 'success').sum()
+    print(f"\nTotal transcripts: {total}")
+    print(f"Successful extractions: {successful}")
+    print(f"Failed extractions: {total - successful} ({dead_letters} in {DEAD_LETTER_FILE})")
     
-    if len(output_df) > 0:
-        success_rate = (output_df['extraction_status'] == 'success').sum() / len(output_df) * 100
+    if total > 0:
+        success_rate = successful / total * 100
         print(f"Success rate: {success_rate:.1f}%")
     
     print(f"\nSentiment distribution:")
@@ -291,7 +1122,6 @@ def main():
     print(f"High priority calls: {(output_df['priority'] == 'high').sum()}")
     
 
-    output_df.to_csv(OUTPUT_FILE, index=False)
     print(f"\n{'='*80}")
     print(f"Results saved to: {OUTPUT_FILE}")
     print(f"  File size: {os.path.getsize(OUTPUT_FILE) / 1024:.2f} KB")
@@ -303,7 +1133,7 @@ def main():
     print("Sample extracted data (first 3 rows):\n")
     sample_cols = ['row_index', 'original_language', 'call_summary', 'intent', 
                    'sentiment', 'car_model', 'is_lead', 'priority']
-    print(output_df[sample_cols].head(3).to_string())
+    print(output_df[sample_cols].head(3).fillna('').to_string())
     
     print("\nExtraction complete!")
 
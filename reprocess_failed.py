@@ -0,0 +1,66 @@
+import os
+import csv
+import pandas as pd
+from tqdm import tqdm
+
+from main import (
+    GEMINI_API_KEY, OUTPUT_FILE, OUTPUT_FIELDS, DEAD_LETTER_FILE, DEAD_LETTER_FIELDS,
+    extract_call_info, get_semantic_cache, clean_transcripts, transcript_keys
+)
+
+
+def main():
+
+    if not GEMINI_API_KEY:
+        print("ERROR: GEMINI_API_KEY not found!")
+        return
+
+    if not os.path.exists(DEAD_LETTER_FILE) or os.path.getsize(DEAD_LETTER_FILE) == 0:
+        print(f"No dead-letter file at {DEAD_LETTER_FILE}, nothing to reprocess")
+        return
+
+    failed_df = pd.read_csv(DEAD_LETTER_FILE, dtype={'language': str, 'transcript': str}, keep_default_na=False)
+    if failed_df.empty:
+        print(f"{DEAD_LETTER_FILE} is empty, nothing to reprocess")
+        return
+
+    print(f"Reprocessing {len(failed_df)} failed rows from {DEAD_LETTER_FILE}...\n")
+
+    write_header = not os.path.exists(OUTPUT_FILE) or os.path.getsize(OUTPUT_FILE) == 0
+    keys = transcript_keys(clean_transcripts(failed_df['transcript']), failed_df['language'])
+    still_failed = []
+
+    with open(OUTPUT_FILE, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS, extrasaction='ignore')
+        if write_header:
+            writer.writeheader()
+
+        for row, key in tqdm(zip(failed_df.itertuples(index=False), keys), total=len(failed_df), desc="Reprocessing"):
+            result = extract_call_info(row.transcript, row.language, row_index=row.row_index)
+
+            if result['extraction_status'] == 'success':
+                writer.writerow({**result, 'transcript_key': key})
+                f.flush()
+            else:
+                still_failed.append({
+                    'row_index': row.row_index,
+                    'language': row.language,
+                    'transcript': row.transcript,
+                    'error': result['error_message'],
+                })
+
+    with open(DEAD_LETTER_FILE, 'w', newline='', encoding='utf-8') as f:
+        dead_letter_writer = csv.DictWriter(f, fieldnames=DEAD_LETTER_FIELDS)
+        dead_letter_writer.writeheader()
+        dead_letter_writer.writerows(still_failed)
+
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        semantic_cache.save()
+
+    print(f"\nRecovered {len(failed_df) - len(still_failed)} rows into {OUTPUT_FILE}")
+    print(f"{len(still_failed)} rows still failing, kept in {DEAD_LETTER_FILE}")
+
+
+if __name__ == "__main__":
+    main()